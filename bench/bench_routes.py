@@ -0,0 +1,416 @@
+"""Route-level benchmarks against a seeded local Postgres.
+
+    python bench/bench_routes.py --database-url postgresql://postgres@localhost/laundry_bench
+
+Seeds the database (see seed.py; it is wiped first), then drives the main
+routes through Flask's test client as a student, an operator and an
+admin. For every route it reports p50/p95/p99 latency plus SQL statements
+and rows (returned or affected) per request. Results are written as JSON
+to bench/results/, and --compare prints the change against an earlier
+file, so a run before and after a change shows what it did.
+
+Single-threaded on purpose: this measures per-request cost. See
+flash_crowd.py for behaviour under concurrency.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+class QueryCounter:
+    """Statements, rows and time spent in SQL since the last reset."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.rows = 0
+        self.sql_seconds = 0.0
+
+
+counter = QueryCounter()
+
+
+def counting_cursor_class(base):
+    class CountingCursor(base):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                counter.queries += 1
+                counter.sql_seconds += time.perf_counter() - started
+                counter.rows += max(self.rowcount, 0)
+
+    return CountingCursor
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+# =====================================================
+# SCENARIOS
+# =====================================================
+
+class Fixtures:
+    """Ids the scenarios need, read once from the seeded database."""
+
+    def __init__(self, cur, today, rng):
+        self.rng = rng
+        self.today = today
+
+        cur.execute("SELECT id FROM users WHERE email IN (%s, %s) ORDER BY id",
+                    (seed.ADMIN_EMAIL, seed.OPERATOR_EMAIL))
+        self.admin_id, self.operator_id = [row["id"] for row in cur.fetchall()]
+
+        cur.execute("SELECT id FROM users WHERE role = 'user' ORDER BY id")
+        self.students = [row["id"] for row in cur.fetchall()]
+
+        # Students who can still book today, one per booking request
+        cur.execute("""
+            SELECT u.id FROM users u
+            WHERE u.role = 'user'
+              AND NOT EXISTS (
+                  SELECT 1 FROM booking_quota q
+                  WHERE q.user_id = u.id AND q.period = 'day' AND q.period_start = %s
+              )
+            ORDER BY u.id
+        """, (today,))
+        self.bookers = [row["id"] for row in cur.fetchall()]
+        rng.shuffle(self.bookers)
+
+        now = datetime.now(laundry.IST).replace(tzinfo=None)
+        cur.execute("""
+            SELECT s.id FROM slots s
+            WHERE (s.slot_date, s.slot_end) > (%s, %s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM bookings b
+                  WHERE b.slot_id = s.id AND b.slot_date = s.slot_date
+                    AND b.status IN ('booked', 'validated')
+              )
+            ORDER BY s.id
+        """, (now.date(), now.time()))
+        self.free_slots = [row["id"] for row in cur.fetchall()]
+        rng.shuffle(self.free_slots)
+
+        cur.execute("SELECT id FROM slots WHERE slot_date >= %s ORDER BY id", (today,))
+        self.future_slots = [row["id"] for row in cur.fetchall()]
+
+        cur.execute("SELECT id, user_id FROM bookings WHERE status <> 'cancelled' ORDER BY id")
+        self.bookings = [(row["id"], row["user_id"]) for row in cur.fetchall()]
+
+        self.etag = None
+
+    def student(self):
+        return self.rng.choice(self.students)
+
+    def booking(self):
+        return self.rng.choice(self.bookings)
+
+
+def login_as(client, user_id, role):
+    with client.session_transaction() as sess:
+        sess.clear()
+        if user_id is not None:
+            sess["user_id"] = user_id
+            sess["role"] = role
+            sess["user_name"] = "Bench"
+
+
+def scenario_login(client, fx):
+    login_as(client, None, None)
+    n = fx.rng.choice(fx.students) - 2
+    return lambda: client.post("/login", data={
+        "email": seed.student_email(n), "password": seed.BENCH_PASSWORD
+    })
+
+
+def student_get(path):
+    def scenario(client, fx):
+        login_as(client, fx.student(), "user")
+        target = path(fx) if callable(path) else path
+        return lambda: client.get(target)
+    return scenario
+
+
+def operator_get(path):
+    def scenario(client, fx):
+        login_as(client, fx.operator_id, "operator")
+        return lambda: client.get(path)
+    return scenario
+
+
+def admin_get(path):
+    def scenario(client, fx):
+        login_as(client, fx.admin_id, "admin")
+        target = path(fx) if callable(path) else path
+        return lambda: client.get(target)
+    return scenario
+
+
+def scenario_api_slots_304(client, fx):
+    login_as(client, fx.student(), "user")
+    if fx.etag is None:
+        fx.etag = client.get(f"/api/slots?date={fx.today}").headers.get("ETag")
+    return lambda: client.get(f"/api/slots?date={fx.today}",
+                              headers={"If-None-Match": fx.etag or ""})
+
+
+def scenario_book(client, fx):
+    if not fx.bookers or not fx.free_slots:
+        return None
+    login_as(client, fx.bookers.pop(), "user")
+    slot_id = fx.free_slots.pop()
+    return lambda: client.post(f"/book/{slot_id}")
+
+
+def scenario_receipt(client, fx):
+    booking_id, user_id = fx.booking()
+    login_as(client, user_id, "user")
+    return lambda: client.get(f"/receipt/{booking_id}")
+
+
+SCENARIOS = [
+    ("login", scenario_login),
+    ("dashboard", student_get("/dashboard")),
+    ("view_slots", student_get("/view_slots")),
+    ("view_slots_week", student_get("/view_slots?tab=week")),
+    ("api_slots", student_get(lambda fx: f"/api/slots?date={fx.today}")),
+    ("api_slots_304", scenario_api_slots_304),
+    ("book_slot_get", student_get(lambda fx: f"/book/{fx.rng.choice(fx.future_slots)}")),
+    ("book_slot_post", scenario_book),
+    ("receipt", scenario_receipt),
+    ("operator_queue", operator_get("/Machine_operator")),
+    ("operator_queue_all", operator_get("/Machine_operator?status=all&hours=72")),
+    ("admin_dashboard", admin_get("/admin")),
+    ("admin_analytics", admin_get("/admin/analytics?days=30")),
+    ("admin_users", admin_get("/admin/users")),
+    ("admin_users_search", admin_get(lambda fx: f"/admin/users?q=student{fx.rng.randint(1, 99)}")),
+    ("view_feedback", admin_get("/view_feedback")),
+    ("view_feedback_search", admin_get("/view_feedback?q=machine+leaking")),
+]
+
+
+def run_scenario(client, fx, make_request, requests, warmup):
+    latencies, queries, rows, sql_ms = [], [], [], []
+    statuses = Counter()
+
+    for i in range(warmup + requests):
+        send = make_request(client, fx)
+        if send is None:
+            break
+
+        counter.reset()
+        started = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - started
+
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(counter.queries)
+        rows.append(counter.rows)
+        sql_ms.append(counter.sql_seconds * 1000)
+        statuses[str(response.status_code)] += 1
+
+    if not latencies:
+        return None
+
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "sql_ms_per_request": round(sum(sql_ms) / len(sql_ms), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 2),
+        "rows_per_request": round(sum(rows) / len(rows), 1),
+        "status_codes": dict(statuses),
+    }
+
+
+# =====================================================
+# REPORTING
+# =====================================================
+
+def print_report(results, baseline=None):
+    base_routes = (baseline or {}).get("routes", {})
+    header = f"{'route':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'rows':>9}"
+    if baseline:
+        header += f"{'p50 Δ':>10}{'p95 Δ':>10}{'queries Δ':>11}"
+    print(header)
+    print("-" * len(header))
+
+    for route, r in results["routes"].items():
+        line = (f"{route:<22}{r['requests']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                f"{r['p99_ms']:>10.2f}{r['queries_per_request']:>9.1f}{r['rows_per_request']:>9.1f}")
+
+        before = base_routes.get(route)
+        if before:
+            line += (f"{change(r['p50_ms'], before['p50_ms']):>10}"
+                     f"{change(r['p95_ms'], before['p95_ms']):>10}"
+                     f"{r['queries_per_request'] - before['queries_per_request']:>+11.1f}")
+
+        errors = sum(n for code, n in r["status_codes"].items() if code.startswith("5"))
+        if errors:
+            line += f"  ({errors} errors)"
+        print(line)
+
+
+def change(now, before):
+    if not before:
+        return "-"
+    return f"{(now - before) / before * 100:+.0f}%"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Throwaway database to seed (default: $BENCH_DATABASE_URL).")
+    parser.add_argument("--sslmode", default="disable",
+                        help="libpq sslmode for the bench database (default: disable).")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="Reuse the data already in the database.")
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--past-days", type=int, default=30, help="Days of slot history.")
+    parser.add_argument("--future-days", type=int, default=7, help="Days of upcoming slots.")
+    parser.add_argument("--fill", type=float, default=0.6, help="Share of slots with a booking.")
+    parser.add_argument("--feedback", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per route.")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per route.")
+    parser.add_argument("--routes", help="Comma-separated subset of routes to run.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and requests.")
+    parser.add_argument("--out", help="Results file (default: bench/results/<time>-<commit>.json).")
+    parser.add_argument("--compare", help="Earlier results file to print changes against.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global laundry, seed
+
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("Set --database-url or BENCH_DATABASE_URL to a throwaway database.")
+
+    # app.py reads its configuration at import time; keep the background
+    # threads out of the measurements
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "DB_SSLMODE": args.sslmode,
+        "DB_LISTEN": "0",
+        "SLOT_SCHEDULER_INTERVAL": "0",
+        "STATS_REFRESH_INTERVAL": "0",
+        "NO_SHOW_SWEEP_INTERVAL": "0",
+        "PARTITION_MAINTENANCE_INTERVAL": "0",
+    })
+    sys.path.insert(0, ROOT)
+    import app as laundry
+    import seed
+
+    laundry._pool = laundry.ConnectionPool(
+        args.database_url,
+        cursor_factory=counting_cursor_class(laundry.InstrumentedCursor),
+        sslmode=args.sslmode,
+        **laundry.POOL_CONFIG
+    )
+    laundry._pool_pid = os.getpid()
+
+    names = [name for name, _ in SCENARIOS]
+    wanted = args.routes.split(",") if args.routes else names
+    unknown = set(wanted) - set(names)
+    if unknown:
+        sys.exit(f"Unknown routes: {', '.join(sorted(unknown))}. Choose from: {', '.join(names)}")
+
+    rng = random.Random(args.seed)
+    today = datetime.now(laundry.IST).date()
+
+    with laundry.app.app_context():
+        db = laundry.get_db()
+        if args.no_seed:
+            dataset = None
+        else:
+            print("Seeding...", flush=True)
+            started = time.perf_counter()
+            dataset = seed.seed(
+                db, machines=args.machines, users=args.users,
+                past_days=args.past_days, future_days=args.future_days,
+                fill=args.fill, feedback=args.feedback, random_seed=args.seed
+            )
+            print(f"Seeded {dataset} in {time.perf_counter() - started:.1f}s", flush=True)
+
+        fx = Fixtures(db.cursor(), today, rng)
+        db.commit()
+
+    client = laundry.app.test_client()
+    results = {
+        "meta": {
+            "commit": git_revision(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("database_url", "out", "compare")},
+            "dataset": dataset,
+        },
+        "routes": {},
+    }
+
+    for name, make_request in SCENARIOS:
+        if name not in wanted:
+            continue
+        result = run_scenario(client, fx, make_request, args.requests, args.warmup)
+        if result is not None:
+            results["routes"][name] = result
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline['meta'].get('commit')})")
+    print_report(results, baseline)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {out}")
+
+    laundry.get_pool().closeall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""Flash-crowd load test: many students racing for the same slots.
+
+    python bench/flash_crowd.py --database-url postgresql://postgres@localhost/laundry_bench
+
+This replays the moment slots open. The script:
+
+1. seeds a throwaway database (see seed.py) and picks --hot-slots free
+   slots on the first upcoming day;
+2. starts the app under gunicorn, configured like production;
+3. releases --clients concurrent sessions at once. Each session loads
+   /view_slots and then tries to book hot slots --attempts times.
+   --sessions-per-user > 1 gives a student several sessions firing
+   together, which is the quota race.
+
+It reports throughput, error rate and per-request latency percentiles,
+then checks the database: no slot holds two active bookings, no student
+booked past their limits during the run, and the quota ledger matches
+the bookings. The exit status is 1 if any check fails.
+
+Sessions get signed cookies directly instead of logging in, so the run
+measures the crowd rather than password hashing.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlencode
+
+from bench_routes import RESULTS_DIR, ROOT, git_revision, percentile
+
+
+class Session:
+    """One logged-in browser: a keep-alive connection and a session cookie."""
+
+    def __init__(self, host, port, cookie):
+        self.host, self.port = host, port
+        self.cookie = cookie
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        headers = {"Cookie": f"session={self.cookie}"}
+        if body is not None:
+            body = urlencode(body)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; retry once on a new one
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+
+        # Keep the cookie fresh: flash messages are stored in it
+        for header, value in response.getheaders():
+            if header.lower() == "set-cookie" and value.startswith("session="):
+                self.cookie = value.split(";", 1)[0].split("=", 1)[1]
+        return response
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)     # kind -> [ms]
+        self.statuses = defaultdict(Counter)  # kind -> status -> n
+        self.errors = Counter()               # "kind: ExceptionName" -> n
+
+    def timed(self, kind, send):
+        started = time.perf_counter()
+        try:
+            response = send()
+        except Exception as e:
+            with self.lock:
+                self.errors[f"{kind}: {type(e).__name__}"] += 1
+                self.statuses[kind]["exception"] += 1
+            return None
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.samples[kind].append(elapsed)
+            self.statuses[kind][str(response.status)] += 1
+        return response
+
+
+def client_run(session, hot_slots, attempts, barrier, recorder, rng):
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        return
+
+    try:
+        recorder.timed("view_slots", lambda: session.request("GET", "/view_slots?tab=tomorrow"))
+        for slot_id in rng.sample(hot_slots, min(attempts, len(hot_slots))):
+            recorder.timed("book_slot", lambda: session.request("POST", f"/book/{slot_id}"))
+    finally:
+        session.close()
+
+
+# =====================================================
+# SERVER
+# =====================================================
+
+def start_server(args, env):
+    command = [
+        "gunicorn", "app:app",
+        "--bind", f"{args.host}:{args.port}",
+        "--workers", str(args.workers),
+        "--worker-class", "gthread",
+        "--threads", str(args.threads),
+        "--backlog", "2048",
+        "--log-level", "warning",
+    ]
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"gunicorn exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection(args.host, args.port, timeout=2)
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.terminate()
+    sys.exit("gunicorn did not start within 30s")
+
+
+# =====================================================
+# INVARIANTS
+# =====================================================
+
+def check_invariants(cur, crowd_users, run_started, limits, today):
+    """Return {check name: [violations]}; empty lists mean the check passed."""
+    violations = {}
+
+    cur.execute("""
+        SELECT slot_id, array_agg(id ORDER BY id) AS booking_ids
+        FROM bookings
+        WHERE status IN ('booked', 'validated')
+        GROUP BY slot_id
+        HAVING COUNT(*) > 1
+    """)
+    violations["double_booked_slots"] = [dict(row) for row in cur.fetchall()]
+
+    # Bookings made during the run alone must fit in every period's limit;
+    # older bookings only make the real allowance smaller.
+    cur.execute("""
+        SELECT b.user_id, p.period, p.period_start, COUNT(*) AS made
+        FROM bookings b
+        CROSS JOIN LATERAL (VALUES
+            ('day', b.created_at::date),
+            ('week', DATE_TRUNC('week', b.created_at)::date),
+            ('month', DATE_TRUNC('month', b.created_at)::date)
+        ) AS p(period, period_start)
+        WHERE b.user_id = ANY(%s)
+          AND b.status <> 'cancelled'
+          AND b.created_at >= %s
+        GROUP BY 1, 2, 3
+    """, (crowd_users, run_started))
+    violations["users_over_quota"] = [
+        {**row, "period_start": str(row["period_start"]), "limit": limits[row["period"]]}
+        for row in cur.fetchall()
+        if row["made"] > limits[row["period"]]
+    ]
+
+    # Crowd users start with no bookings today, so today's ledger entry must
+    # equal what they actually hold
+    cur.execute("""
+        SELECT u.id AS user_id,
+               COALESCE(q.used, 0) AS ledger,
+               (SELECT COUNT(*) FROM bookings b
+                WHERE b.user_id = u.id AND b.status <> 'cancelled'
+                  AND b.created_at::date = %(today)s) AS actual
+        FROM unnest(%(users)s::int[]) AS u(id)
+        LEFT JOIN booking_quota q
+               ON q.user_id = u.id AND q.period = 'day' AND q.period_start = %(today)s
+    """, {"users": crowd_users, "today": today})
+    violations["quota_ledger_drift"] = [
+        dict(row) for row in cur.fetchall() if row["ledger"] != row["actual"]
+    ]
+
+    return violations
+
+
+def summarize(recorder, elapsed):
+    total = sum(len(v) for v in recorder.samples.values()) + sum(recorder.errors.values())
+    failed = sum(recorder.errors.values()) + sum(
+        n for statuses in recorder.statuses.values()
+        for code, n in statuses.items() if code.startswith("5")
+    )
+
+    kinds = {}
+    for kind, samples in recorder.samples.items():
+        kinds[kind] = {
+            "requests": len(samples),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+            "max_ms": round(max(samples), 2),
+            "status_codes": dict(recorder.statuses[kind]),
+        }
+
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "errors": dict(recorder.errors),
+        "kinds": kinds,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Throwaway database to seed (default: $BENCH_DATABASE_URL).")
+    parser.add_argument("--sslmode", default="disable")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--threads", type=int, default=16, help="Threads per worker (gthread).")
+    parser.add_argument("--clients", type=int, default=300, help="Concurrent sessions.")
+    parser.add_argument("--sessions-per-user", type=int, default=2,
+                        help="Sessions sharing one student, to race the quota.")
+    parser.add_argument("--hot-slots", type=int, default=20, help="Slots everyone goes for.")
+    parser.add_argument("--attempts", type=int, default=3, help="Booking attempts per session.")
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--past-days", type=int, default=7)
+    parser.add_argument("--future-days", type=int, default=2)
+    parser.add_argument("--fill", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Results file (default: bench/results/crowd-<time>-<commit>.json).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("Set --database-url or BENCH_DATABASE_URL to a throwaway database.")
+
+    # The crowd is the only load: no scheduler, rollups, sweeps or
+    # partition maintenance rewriting rows under the invariant checks
+    env = dict(os.environ,
+               DATABASE_URL=args.database_url,
+               DB_SSLMODE=args.sslmode,
+               DB_POOL_MAX=str(args.threads),
+               SLOT_SCHEDULER_INTERVAL="0",
+               STATS_REFRESH_INTERVAL="0",
+               NO_SHOW_SWEEP_INTERVAL="0",
+               PARTITION_MAINTENANCE_INTERVAL="0")
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    import app as laundry
+    import seed
+
+    rng = random.Random(args.seed)
+    today = datetime.now(laundry.IST).date()
+
+    with laundry.app.app_context():
+        db = laundry.get_db()
+        cur = db.cursor()
+        if not args.no_seed:
+            print("Seeding...", flush=True)
+            seed.seed(db, machines=args.machines, users=args.users,
+                      past_days=args.past_days, future_days=args.future_days,
+                      fill=args.fill, random_seed=args.seed)
+
+        limits = laundry.booking_limits(laundry.get_settings())
+
+        # Bookings and the quota ledger are stamped with the database's clock
+        cur.execute("SELECT CURRENT_DATE AS today")
+        db_today = cur.fetchone()["today"]
+
+        # Free slots on the first upcoming day are the ones being released
+        cur.execute("""
+            SELECT s.id FROM slots s
+            WHERE s.slot_date = (SELECT MIN(slot_date) FROM slots WHERE slot_date > %(today)s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM bookings b
+                  WHERE b.slot_id = s.id AND b.slot_date = s.slot_date
+                    AND b.status IN ('booked', 'validated')
+              )
+            ORDER BY s.id
+        """, {"today": today})
+        free = [row["id"] for row in cur.fetchall()]
+        if not free:
+            sys.exit("No free upcoming slots; reseed with a lower --fill or more --future-days.")
+        hot_slots = rng.sample(free, min(args.hot_slots, len(free)))
+
+        # Students with nothing booked yet today
+        cur.execute("""
+            SELECT u.id, u.name FROM users u
+            WHERE u.role = 'user'
+              AND NOT EXISTS (
+                  SELECT 1 FROM bookings b
+                  WHERE b.user_id = u.id AND b.status <> 'cancelled'
+                    AND b.created_at::date = %s
+              )
+            ORDER BY u.id
+        """, (db_today,))
+        candidates = cur.fetchall()
+        db.commit()
+
+    users_needed = -(-args.clients // args.sessions_per_user)
+    if len(candidates) < users_needed:
+        sys.exit(f"Only {len(candidates)} students are free today; need {users_needed}.")
+    crowd = rng.sample(candidates, users_needed)
+
+    signer = laundry.app.session_interface.get_signing_serializer(laundry.app)
+    sessions = [
+        Session(args.host, args.port, signer.dumps({
+            "user_id": user["id"], "role": "user", "user_name": user["name"]
+        }))
+        for user in crowd for _ in range(args.sessions_per_user)
+    ][:args.clients]
+
+    server = start_server(args, env)
+    recorder = Recorder()
+    barrier = threading.Barrier(len(sessions) + 1)
+
+    try:
+        threads = [
+            threading.Thread(
+                target=client_run,
+                args=(session, hot_slots, args.attempts, barrier, recorder,
+                      random.Random(rng.random())),
+                daemon=True
+            )
+            for session in sessions
+        ]
+        for t in threads:
+            t.start()
+
+        with laundry.app.app_context():
+            cur = laundry.get_db().cursor()
+            cur.execute("SELECT LOCALTIMESTAMP AS now")
+            run_started = cur.fetchone()["now"]
+
+        print(f"Releasing {len(sessions)} sessions on {len(hot_slots)} slots...", flush=True)
+        barrier.wait()
+        started = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    summary = summarize(recorder, elapsed)
+
+    with laundry.app.app_context():
+        db = laundry.get_db()
+        cur = db.cursor()
+        violations = check_invariants(
+            cur, [user["id"] for user in crowd], run_started, limits, db_today
+        )
+        cur.execute(
+            "SELECT COUNT(*) AS n FROM bookings WHERE slot_id = ANY(%s) AND status = 'booked'",
+            (hot_slots,)
+        )
+        summary["hot_slots_booked"] = cur.fetchone()["n"]
+
+    results = {
+        "meta": {
+            "commit": git_revision(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("database_url", "out")},
+            "limits": limits,
+        },
+        "summary": summary,
+        "invariants": violations,
+    }
+
+    print(f"{summary['requests']} requests in {summary['seconds']}s "
+          f"({summary['throughput_rps']} req/s), error rate {summary['error_rate']:.2%}")
+    for kind, k in summary["kinds"].items():
+        print(f"  {kind:<12} n={k['requests']:<6} p50={k['p50_ms']:.1f}ms "
+              f"p95={k['p95_ms']:.1f}ms p99={k['p99_ms']:.1f}ms max={k['max_ms']:.1f}ms "
+              f"{k['status_codes']}")
+    print(f"  hot slots booked: {summary['hot_slots_booked']}/{len(hot_slots)}")
+
+    failed = False
+    for check, found in violations.items():
+        print(f"  {check}: {'ok' if not found else f'{len(found)} VIOLATIONS'}")
+        failed = failed or bool(found)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"crowd-{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Saved {out}")
+
+    laundry.get_pool().closeall()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
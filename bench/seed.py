@@ -0,0 +1,143 @@
+"""Seed a local Postgres with a generated laundry dataset for benchmarks.
+
+Every app table is wiped and refilled with users, machines, a window of
+past and future slots, bookings in every status and some feedback. The
+sizes are parameters so runs at different scales stay comparable, and
+random choices are seeded so the same parameters give the same data.
+
+Only point this at a throwaway database: it TRUNCATEs everything.
+"""
+
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import app as laundry
+import migrations
+import passwords
+
+BENCH_PASSWORD = "bench-password"
+ADMIN_EMAIL = "admin@bench.local"
+OPERATOR_EMAIL = "operator@bench.local"
+
+SEED_TABLES = [
+    "feedback", "booking_quota", "bookings", "slots", "machines", "users",
+    "slot_availability", "booking_stats_hourly", "stats_counters",
+]
+
+FEEDBACK_MESSAGES = [
+    "Machine {m} left clothes damp, dryer cycle seems too short",
+    "Washer {m} is leaking water near the door",
+    "Great service, the booking reminders are really useful",
+    "Could we get more evening slots on weekends?",
+    "Detergent dispenser on machine {m} is jammed",
+    "Someone took my slot on machine {m} without booking",
+]
+
+
+def student_email(n):
+    return f"student{n}@bench.local"
+
+
+def seed(db, machines=10, users=2000, past_days=30, future_days=7,
+         fill=0.6, feedback=500, random_seed=42):
+    """Reset the schema on ``db`` and fill it; returns the row counts."""
+    migrations.upgrade(db, echo=lambda message: None)
+    cur = db.cursor()
+
+    cur.execute("SELECT setseed(%s)", (random_seed % 1000 / 1000,))
+    cur.execute(f"TRUNCATE {', '.join(SEED_TABLES)} RESTART IDENTITY CASCADE")
+
+    # One hash for every account: hashing thousands of passwords would
+    # dominate the seed time and tells us nothing about the app
+    password_hash = generate_password_hash(BENCH_PASSWORD, passwords.HASH_METHOD)
+
+    cur.execute("""
+        INSERT INTO users (name, email, rollno, password_hash, phone, role)
+        VALUES ('Bench Admin', %(admin)s, 'ADMIN', %(hash)s, '9000000000', 'admin'),
+               ('Bench Operator', %(operator)s, 'OPERATOR', %(hash)s, '9000000001', 'operator')
+    """, {"admin": ADMIN_EMAIL, "operator": OPERATOR_EMAIL, "hash": password_hash})
+    cur.execute("""
+        INSERT INTO users (name, email, rollno, password_hash, phone, role)
+        SELECT 'Student ' || g, 'student' || g || '@bench.local', 'R' || lpad(g::text, 6, '0'),
+               %(hash)s, '9' || lpad(g::text, 9, '0'), 'user'
+        FROM generate_series(1, %(users)s) g
+    """, {"users": users, "hash": password_hash})
+
+    cur.execute("""
+        INSERT INTO machines (name, location, status)
+        SELECT 'Machine ' || g, 'Block ' || chr(64 + (g - 1) %% 4 + 1), 'available'
+        FROM generate_series(1, %s) g
+    """, (machines,))
+
+    cur.execute("SELECT * FROM system_settings WHERE id = 1")
+    settings = cur.fetchone()
+    today = datetime.now(laundry.IST).date()
+    first_day = today - timedelta(days=past_days)
+    last_day = today + timedelta(days=future_days)
+
+    # Slot times only depend on the settings, so one day's list serves every day
+    starts, ends = laundry.slot_times(settings, today)
+    laundry.ensure_partitions(cur, first_day, last_day)
+    cur.execute("""
+        INSERT INTO slots (machine_id, slot_date, slot_start, slot_end)
+        SELECT m.id, d::date, t.slot_start, t.slot_end
+        FROM machines m
+        CROSS JOIN generate_series(%(first)s::date, %(last)s::date, interval '1 day') d
+        CROSS JOIN unnest(%(starts)s::time[], %(ends)s::time[]) AS t(slot_start, slot_end)
+        ORDER BY d, m.id, t.slot_start
+    """, {"first": first_day, "last": last_day, "starts": starts, "ends": ends})
+
+    # Past slots mostly got used; future ones are booked or were cancelled.
+    # Bookings are made up to three days ahead of the slot.
+    now = datetime.now(laundry.IST).replace(tzinfo=None)
+    cur.execute("""
+        INSERT INTO bookings (user_id, slot_id, slot_date, status, created_at)
+        SELECT 3 + floor(random() * %(users)s)::int,
+               s.id,
+               s.slot_date,
+               CASE
+                   WHEN s.slot_date + s.slot_end >= %(now)s
+                       THEN CASE WHEN r < 0.9 THEN 'booked' ELSE 'cancelled' END
+                   WHEN r < 0.75 THEN 'validated'
+                   WHEN r < 0.9 THEN 'booked'
+                   ELSE 'cancelled'
+               END,
+               LEAST(s.slot_date + s.slot_start - random() * interval '3 days', %(now)s)
+        FROM (SELECT s.*, random() AS r FROM slots s) s
+        WHERE random() < %(fill)s
+    """, {"users": users, "now": now, "fill": fill})
+
+    cur.execute("""
+        INSERT INTO feedback (user_id, message, created_at)
+        SELECT 3 + floor(random() * %(users)s)::int,
+               replace((%(messages)s::text[])[1 + floor(random() * %(kinds)s)::int],
+                       '{m}', (1 + floor(random() * %(machines)s))::int::text),
+               %(now)s - random() * (%(days)s * interval '1 day')
+        FROM generate_series(1, %(feedback)s)
+    """, {"users": users, "messages": FEEDBACK_MESSAGES, "kinds": len(FEEDBACK_MESSAGES),
+          "machines": machines, "now": now, "days": past_days, "feedback": feedback})
+
+    cur.execute("""
+        INSERT INTO slot_availability (slot_date, version)
+        SELECT DISTINCT slot_date, 1 FROM slots
+    """)
+    laundry.rebuild_quotas(cur)
+
+    cur.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM users) AS users,
+            (SELECT COUNT(*) FROM machines) AS machines,
+            (SELECT COUNT(*) FROM slots) AS slots,
+            (SELECT COUNT(*) FROM bookings) AS bookings,
+            (SELECT COUNT(*) FROM feedback) AS feedback
+    """)
+    counts = dict(cur.fetchone())
+    db.commit()
+
+    cur.execute("ANALYZE")
+    db.commit()
+
+    # The rollups the admin pages read from
+    laundry.refresh_stats(first_day, last_day)
+    return counts
@@ -0,0 +1,478 @@
+"""Versioned database schema for the laundry app.
+
+Migrations run in order, each in its own transaction, and are recorded in
+``schema_migrations`` so every one is applied exactly once. Apply them with
+``flask db upgrade``; ``flask db status`` lists what has been applied.
+
+Every statement is written to be safe against databases that were set up
+by hand before this module existed (IF NOT EXISTS everywhere).
+"""
+
+MIGRATIONS_LOCK = 7300         # pg advisory-lock key held while upgrading
+
+# (version, description, statements)
+MIGRATIONS = [
+    (1, "base schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            rollno TEXT,
+            password_hash TEXT NOT NULL,
+            phone TEXT,
+            role TEXT NOT NULL DEFAULT 'user'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS machines (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            location TEXT,
+            status TEXT NOT NULL DEFAULT 'available'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS slots (
+            id SERIAL PRIMARY KEY,
+            machine_id INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+            slot_date DATE NOT NULL,
+            slot_start TIME NOT NULL,
+            slot_end TIME NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS bookings (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            slot_id INTEGER NOT NULL REFERENCES slots(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'booked',
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS system_settings (
+            id INTEGER PRIMARY KEY,
+            start_time TIME NOT NULL DEFAULT '06:00',
+            end_time TIME NOT NULL DEFAULT '22:00',
+            wash_duration INTEGER NOT NULL DEFAULT 30,
+            break_after INTEGER NOT NULL DEFAULT 4,
+            break_duration INTEGER NOT NULL DEFAULT 60,
+            daily_limit INTEGER NOT NULL DEFAULT 1,
+            weekly_limit INTEGER NOT NULL DEFAULT 2,
+            monthly_limit INTEGER NOT NULL DEFAULT 8,
+            auto_generate BOOLEAN NOT NULL DEFAULT TRUE,
+            slots_per_day INTEGER NOT NULL DEFAULT 20
+        )
+        """,
+        "INSERT INTO system_settings (id) VALUES (1) ON CONFLICT (id) DO NOTHING",
+    ]),
+
+    (2, "indexes for the hot queries", [
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_email_uniq ON users (email)",
+        "CREATE INDEX IF NOT EXISTS bookings_slot_status_idx ON bookings (slot_id, status)",
+        "CREATE INDEX IF NOT EXISTS bookings_user_created_idx ON bookings (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS slots_date_start_idx ON slots (slot_date, slot_start)",
+        "CREATE INDEX IF NOT EXISTS slots_machine_date_idx ON slots (machine_id, slot_date)",
+        "CREATE INDEX IF NOT EXISTS feedback_created_idx ON feedback (created_at DESC, id DESC)",
+    ]),
+
+    (3, "per-day slot availability versions", [
+        """
+        CREATE TABLE IF NOT EXISTS slot_availability (
+            slot_date DATE PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+
+    (4, "one active booking per slot", [
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS bookings_active_slot_uniq
+        ON bookings (slot_id) WHERE status IN ('booked', 'validated')
+        """,
+    ]),
+
+    (5, "booking quota ledger", [
+        """
+        CREATE TABLE IF NOT EXISTS booking_quota (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            period TEXT NOT NULL,                -- 'day', 'week' or 'month'
+            period_start DATE NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, period, period_start)
+        )
+        """,
+        # Seed the current periods from existing bookings
+        """
+        INSERT INTO booking_quota (user_id, period, period_start, used)
+        SELECT b.user_id, p.period, p.period_start, COUNT(*)
+        FROM bookings b
+        CROSS JOIN LATERAL (VALUES
+            ('day', b.created_at::date),
+            ('week', DATE_TRUNC('week', b.created_at)::date),
+            ('month', DATE_TRUNC('month', b.created_at)::date)
+        ) AS p(period, period_start)
+        WHERE b.status <> 'cancelled'
+          AND b.created_at >= LEAST(DATE_TRUNC('week', CURRENT_DATE),
+                                    DATE_TRUNC('month', CURRENT_DATE))
+        GROUP BY b.user_id, p.period, p.period_start
+        ON CONFLICT (user_id, period, period_start) DO NOTHING
+        """,
+    ]),
+
+    (6, "stats rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS booking_stats_hourly (
+            stat_date DATE NOT NULL,
+            machine_id INTEGER NOT NULL,
+            stat_hour SMALLINT NOT NULL,
+            slots INTEGER NOT NULL DEFAULT 0,
+            booked INTEGER NOT NULL DEFAULT 0,       -- bookings made, any status
+            validated INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            no_show INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stat_date, machine_id, stat_hour)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+
+    (7, "trigram indexes for user search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS users_name_trgm_idx ON users USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS users_email_trgm_idx ON users USING gin (email gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS users_rollno_trgm_idx ON users USING gin (rollno gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS users_phone_trgm_idx ON users USING gin (phone gin_trgm_ops)",
+    ]),
+
+    (8, "feedback full-text search", [
+        """
+        ALTER TABLE feedback ADD COLUMN IF NOT EXISTS message_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', COALESCE(message, ''))) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS feedback_message_tsv_idx ON feedback USING gin (message_tsv)",
+    ]),
+
+    (9, "partition slots and bookings by month, with an archive schema", [
+        # Creates the monthly partitions (slots_pYYYY_MM, bookings_pYYYY_MM)
+        # covering first_day..last_day that don't exist yet, live or archived.
+        # Months that already have rows in a default partition are skipped:
+        # Postgres refuses to create a partition that would take them over.
+        """
+        CREATE OR REPLACE FUNCTION ensure_month_partitions(first_day DATE, last_day DATE)
+        RETURNS INTEGER LANGUAGE plpgsql AS $$
+        DECLARE
+            m DATE := date_trunc('month', first_day)::date;
+            next_m DATE;
+            suffix TEXT;
+            created INTEGER := 0;
+        BEGIN
+            WHILE m <= last_day LOOP
+                next_m := (m + interval '1 month')::date;
+                suffix := to_char(m, 'YYYY_MM');
+
+                IF to_regclass('public.slots_p' || suffix) IS NULL
+                   AND to_regclass('archive.slots_p' || suffix) IS NULL THEN
+                    IF EXISTS (SELECT 1 FROM public.slots_default
+                               WHERE slot_date >= m AND slot_date < next_m) THEN
+                        RAISE NOTICE 'slots_p% not created: its rows are in slots_default', suffix;
+                    ELSE
+                        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.slots
+                                        FOR VALUES FROM (%L) TO (%L)', 'slots_p' || suffix, m, next_m);
+                        created := created + 1;
+                    END IF;
+                END IF;
+
+                IF to_regclass('public.bookings_p' || suffix) IS NULL
+                   AND to_regclass('archive.bookings_p' || suffix) IS NULL THEN
+                    IF EXISTS (SELECT 1 FROM public.bookings_default
+                               WHERE slot_date >= m AND slot_date < next_m) THEN
+                        RAISE NOTICE 'bookings_p% not created: its rows are in bookings_default', suffix;
+                    ELSE
+                        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.bookings
+                                        FOR VALUES FROM (%L) TO (%L)', 'bookings_p' || suffix, m, next_m);
+                        created := created + 1;
+                    END IF;
+                END IF;
+
+                m := next_m;
+            END LOOP;
+
+            RETURN created;
+        END
+        $$
+        """,
+        # Convert the plain tables, once. Bookings carry their slot's date so
+        # both tables share the partition key and a month moves as a unit.
+        """
+        DO $$
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'public.slots'::regclass) = 'p' THEN
+                RETURN;
+            END IF;
+
+            DROP INDEX IF EXISTS bookings_active_slot_uniq, bookings_slot_status_idx,
+                bookings_user_created_idx, slots_date_start_idx, slots_machine_date_idx;
+            ALTER TABLE bookings RENAME TO bookings_unpartitioned;
+            ALTER TABLE slots RENAME TO slots_unpartitioned;
+            ALTER INDEX IF EXISTS bookings_pkey RENAME TO bookings_unpartitioned_pkey;
+            ALTER INDEX IF EXISTS slots_pkey RENAME TO slots_unpartitioned_pkey;
+            ALTER SEQUENCE slots_id_seq OWNED BY NONE;
+            ALTER SEQUENCE bookings_id_seq OWNED BY NONE;
+
+            CREATE TABLE slots (
+                id INTEGER NOT NULL DEFAULT nextval('slots_id_seq'),
+                machine_id INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+                slot_date DATE NOT NULL,
+                slot_start TIME NOT NULL,
+                slot_end TIME NOT NULL,
+                PRIMARY KEY (id, slot_date)
+            ) PARTITION BY RANGE (slot_date);
+
+            CREATE TABLE bookings (
+                id INTEGER NOT NULL DEFAULT nextval('bookings_id_seq'),
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                slot_id INTEGER NOT NULL,
+                slot_date DATE NOT NULL,
+                status TEXT NOT NULL DEFAULT 'booked',
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, slot_date),
+                FOREIGN KEY (slot_id, slot_date) REFERENCES slots (id, slot_date) ON DELETE CASCADE
+            ) PARTITION BY RANGE (slot_date);
+
+            ALTER SEQUENCE slots_id_seq OWNED BY slots.id;
+            ALTER SEQUENCE bookings_id_seq OWNED BY bookings.id;
+
+            CREATE TABLE slots_default PARTITION OF slots DEFAULT;
+            CREATE TABLE bookings_default PARTITION OF bookings DEFAULT;
+
+            PERFORM ensure_month_partitions(
+                LEAST((SELECT MIN(slot_date) FROM slots_unpartitioned), CURRENT_DATE),
+                (CURRENT_DATE + interval '3 months')::date
+            );
+
+            INSERT INTO slots (id, machine_id, slot_date, slot_start, slot_end)
+            SELECT id, machine_id, slot_date, slot_start, slot_end FROM slots_unpartitioned;
+
+            INSERT INTO bookings (id, user_id, slot_id, slot_date, status, created_at)
+            SELECT b.id, b.user_id, b.slot_id, s.slot_date, b.status, b.created_at
+            FROM bookings_unpartitioned b
+            JOIN slots_unpartitioned s ON s.id = b.slot_id;
+
+            DROP TABLE bookings_unpartitioned;
+            DROP TABLE slots_unpartitioned;
+
+            CREATE INDEX slots_date_start_idx ON slots (slot_date, slot_start);
+            CREATE INDEX slots_machine_date_idx ON slots (machine_id, slot_date);
+            CREATE INDEX bookings_slot_status_idx ON bookings (slot_id, status);
+            CREATE INDEX bookings_user_created_idx ON bookings (user_id, created_at);
+            CREATE UNIQUE INDEX bookings_active_slot_uniq
+                ON bookings (slot_id, slot_date) WHERE status IN ('booked', 'validated');
+        END
+        $$
+        """,
+        # Archived months are re-attached under these, so history stays one
+        # query away (see the *_all views) without weighing on the live tables
+        "CREATE SCHEMA IF NOT EXISTS archive",
+        """
+        CREATE TABLE IF NOT EXISTS archive.slots (
+            id INTEGER NOT NULL,
+            machine_id INTEGER NOT NULL,
+            slot_date DATE NOT NULL,
+            slot_start TIME NOT NULL,
+            slot_end TIME NOT NULL,
+            PRIMARY KEY (id, slot_date)
+        ) PARTITION BY RANGE (slot_date)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS archive.bookings (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            slot_id INTEGER NOT NULL,
+            slot_date DATE NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, slot_date)
+        ) PARTITION BY RANGE (slot_date)
+        """,
+        "CREATE INDEX IF NOT EXISTS archive_bookings_user_created_idx ON archive.bookings (user_id, created_at)",
+        """
+        CREATE OR REPLACE VIEW slots_all AS
+            SELECT id, machine_id, slot_date, slot_start, slot_end FROM slots
+            UNION ALL
+            SELECT id, machine_id, slot_date, slot_start, slot_end FROM archive.slots
+        """,
+        """
+        CREATE OR REPLACE VIEW bookings_all AS
+            SELECT id, user_id, slot_id, slot_date, status, created_at FROM bookings
+            UNION ALL
+            SELECT id, user_id, slot_id, slot_date, status, created_at FROM archive.bookings
+        """,
+        # Moves every month that ended on or before ``before`` from the live
+        # tables to archive.slots / archive.bookings.
+        """
+        CREATE OR REPLACE FUNCTION archive_month_partitions(before DATE)
+        RETURNS INTEGER LANGUAGE plpgsql AS $$
+        DECLARE
+            suffix TEXT;
+            first_day DATE;
+            fk RECORD;
+            archived INTEGER := 0;
+        BEGIN
+            FOR suffix IN
+                SELECT substr(c.relname, length('bookings_p') + 1)
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'public.bookings'::regclass
+                  AND c.relname ~ '^bookings_p[0-9]{4}_[0-9]{2}$'
+                ORDER BY 1
+            LOOP
+                first_day := to_date(suffix, 'YYYY_MM');
+                EXIT WHEN first_day + interval '1 month' > before;
+
+                EXECUTE format('ALTER TABLE public.bookings DETACH PARTITION public.%I',
+                               'bookings_p' || suffix);
+
+                -- The month's link to the live slots would stop that month's
+                -- slots from being detached; it is re-made inside the archive
+                FOR fk IN
+                    SELECT conname FROM pg_constraint
+                    WHERE conrelid = ('public.bookings_p' || suffix)::regclass
+                      AND contype = 'f'
+                      AND confrelid = 'public.slots'::regclass
+                LOOP
+                    EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I',
+                                   'bookings_p' || suffix, fk.conname);
+                END LOOP;
+
+                IF to_regclass('public.slots_p' || suffix) IS NOT NULL THEN
+                    EXECUTE format('ALTER TABLE public.slots DETACH PARTITION public.%I',
+                                   'slots_p' || suffix);
+                    EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', 'slots_p' || suffix);
+                    EXECUTE format('ALTER TABLE archive.slots ATTACH PARTITION archive.%I
+                                    FOR VALUES FROM (%L) TO (%L)',
+                                   'slots_p' || suffix, first_day, first_day + interval '1 month');
+                END IF;
+
+                EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', 'bookings_p' || suffix);
+                EXECUTE format('ALTER TABLE archive.bookings ATTACH PARTITION archive.%I
+                                FOR VALUES FROM (%L) TO (%L)',
+                               'bookings_p' || suffix, first_day, first_day + interval '1 month');
+
+                IF to_regclass('archive.slots_p' || suffix) IS NOT NULL THEN
+                    EXECUTE format('ALTER TABLE archive.%I ADD FOREIGN KEY (slot_id, slot_date)
+                                    REFERENCES archive.%I (id, slot_date) ON DELETE CASCADE',
+                                   'bookings_p' || suffix, 'slots_p' || suffix);
+                END IF;
+
+                archived := archived + 1;
+            END LOOP;
+
+            RETURN archived;
+        END
+        $$
+        """,
+    ]),
+
+    (10, "index the bookings still awaiting their slot", [
+        # Only 'booked' rows, which the no-show sweeper keeps to the live ones
+        "CREATE INDEX IF NOT EXISTS bookings_booked_slot_date_idx ON bookings (slot_date) WHERE status = 'booked'",
+    ]),
+
+    (11, "announce slot availability bumps", [
+        # Every writer of slot_availability (bump_availability, the booking
+        # and cancelling CTEs) is covered, so workers can keep the versions
+        # in memory. The channel is app.AVAILABILITY_CHANNEL.
+        """
+        CREATE OR REPLACE FUNCTION notify_slot_availability() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('slot_availability',
+                              json_build_object(NEW.slot_date, NEW.version)::text);
+            RETURN NULL;
+        END
+        $$
+        """,
+        "DROP TRIGGER IF EXISTS slot_availability_notify ON slot_availability",
+        """
+        CREATE TRIGGER slot_availability_notify
+        AFTER INSERT OR UPDATE ON slot_availability
+        FOR EACH ROW EXECUTE FUNCTION notify_slot_availability()
+        """,
+    ]),
+]
+
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cur):
+    ensure_migrations_table(cur)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cur.fetchall()}
+
+
+def pending(cur):
+    done = applied_versions(cur)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(conn, target=None, echo=print):
+    """Apply pending migrations up to ``target`` (default: all) on ``conn``.
+
+    Returns the versions that were applied.
+    """
+    cur = conn.cursor()
+
+    # Only one process migrates at a time; the others wait, then find nothing to do
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK,))
+    conn.commit()
+
+    applied = []
+    try:
+        for version, description, statements in pending(cur):
+            if target is not None and version > target:
+                break
+
+            echo(f"Applying {version}: {description}")
+            try:
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            applied.append(version)
+
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK,))
+        conn.commit()
+
+    return applied
@@ -0,0 +1,201 @@
+"""Password hashing off the request threads.
+
+Password KDFs are slow on purpose. Run inline, a burst of logins holds
+every worker thread (and the GIL) and stalls every other route. Here the
+hashing runs in a small process pool per worker, behind three limits:
+
+* at most PASSWORD_HASH_MAX_PENDING hashes queued or running per worker;
+* at most PASSWORD_HASH_PER_EMAIL at once for one account;
+* at most PASSWORD_HASH_PER_IP at once for one client address. Off by
+  default: a hostel behind one NAT address would share it.
+
+Callers wait up to PASSWORD_HASH_WAIT seconds in all, for room under the
+limits and for the hash itself; after that HashBusy is raised, which
+routes turn into a "try again". So is a hashing process dying, after the
+pool has been rebuilt and the hash retried once.
+PASSWORD_HASH_METHOD takes any werkzeug method string, e.g.
+"scrypt:32768:8:1" or "pbkdf2:sha256:600000". Hashes stored with other
+parameters are upgraded at the next successful login (see needs_rehash).
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+HASH_PROCESSES = int(os.getenv("PASSWORD_HASH_PROCESSES", 2))       # per worker; 0 hashes inline
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+HASH_WAIT = float(os.getenv("PASSWORD_HASH_WAIT", 5))               # seconds
+HASH_PER_IP = int(os.getenv("PASSWORD_HASH_PER_IP", 0))             # 0 disables the limit
+HASH_PER_EMAIL = int(os.getenv("PASSWORD_HASH_PER_EMAIL", 2))
+
+
+class HashBusy(Exception):
+    """Too many hashes are already running for this client, account or worker."""
+
+
+_lock = threading.Lock()
+_released = threading.Condition(_lock)   # signalled when a per-client hash finishes
+_state_pid = None
+_executor = None
+_pending = None
+_in_flight = {}          # (kind, value) -> running hashes
+_method_prefix = None
+
+
+def _new_executor():
+    # spawn, not fork: the children only need werkzeug, and forking a
+    # threaded worker can copy held locks
+    return ProcessPoolExecutor(
+        max_workers=HASH_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn")
+    ) if HASH_PROCESSES > 0 else None
+
+
+def _state():
+    """The executor and pending-slot semaphore of this process (gunicorn forks)."""
+    global _state_pid, _executor, _pending, _in_flight
+
+    if _state_pid != os.getpid():
+        with _lock:
+            if _state_pid != os.getpid():
+                _executor = _new_executor()
+                _pending = threading.BoundedSemaphore(HASH_MAX_PENDING)
+                _in_flight = {}
+                _state_pid = os.getpid()
+
+    return _executor, _pending
+
+
+def _replace_executor(broken):
+    """Swap in a new pool after a child died (OOM kill, crash); a broken pool never recovers."""
+    global _executor
+
+    with _lock:
+        if _executor is broken:
+            _executor = _new_executor()
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _call(fn, arg_lists, deadline=None):
+    """Run ``fn`` once per argument tuple on the pool and return the results in order.
+
+    Raises HashBusy if ``deadline`` passes first or the pool breaks twice.
+    """
+    for _ in range(2):
+        executor, _ = _state()
+        futures = []
+        try:
+            futures = [executor.submit(fn, *args) for args in arg_lists]
+            return [
+                f.result(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+                for f in futures
+            ]
+        except FutureTimeout:
+            for f in futures:
+                f.cancel()
+            raise HashBusy("Password hashing took too long")
+        except BrokenProcessPool:
+            _replace_executor(executor)
+
+    raise HashBusy("Password hashing processes keep failing")
+
+
+def _claim(keys, deadline):
+    with _released:
+        while True:
+            busy = [key for key, limit in keys if _in_flight.get(key, 0) >= limit]
+            if not busy:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HashBusy(f"Too many password attempts in progress for {busy[0][0]}")
+            _released.wait(remaining)
+
+        for key, _ in keys:
+            _in_flight[key] = _in_flight.get(key, 0) + 1
+
+
+def _unclaim(keys):
+    with _released:
+        for key, _ in keys:
+            remaining = _in_flight[key] - 1
+            if remaining:
+                _in_flight[key] = remaining
+            else:
+                del _in_flight[key]
+        _released.notify_all()
+
+
+def _run(fn, *args, ip=None, email=None):
+    executor, pending = _state()
+    deadline = time.monotonic() + HASH_WAIT
+
+    keys = []
+    if ip and HASH_PER_IP > 0:
+        keys.append((("ip", ip), HASH_PER_IP))
+    if email and HASH_PER_EMAIL > 0:
+        keys.append((("email", email), HASH_PER_EMAIL))
+
+    _claim(keys, deadline)
+    try:
+        if not pending.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise HashBusy("Password hashing is saturated")
+        try:
+            if executor is None:
+                return fn(*args)
+            return _call(fn, [args], deadline)[0]
+        finally:
+            pending.release()
+    finally:
+        _unclaim(keys)
+
+
+def hash_password(password, ip=None, email=None):
+    return _run(generate_password_hash, password, HASH_METHOD, ip=ip, email=email)
+
+
+def check_password(stored_hash, password, ip=None, email=None):
+    return _run(check_password_hash, stored_hash, password, ip=ip, email=email)
+
+
+def hash_passwords(passwords):
+    """Hash many passwords on the pool (bulk imports); no per-client limits.
+
+    They go in rounds of one per hashing process, each holding a pending
+    slot, so a login arriving meanwhile queues behind one round rather
+    than the whole batch.
+    """
+    executor, pending = _state()
+    if executor is None:
+        return [generate_password_hash(p, HASH_METHOD) for p in passwords]
+
+    hashes = []
+    for start in range(0, len(passwords), HASH_PROCESSES):
+        chunk = passwords[start:start + HASH_PROCESSES]
+        for _ in chunk:
+            pending.acquire()
+        try:
+            hashes += _call(generate_password_hash, [(p, HASH_METHOD) for p in chunk])
+        finally:
+            for _ in chunk:
+                pending.release()
+
+    return hashes
+
+
+def needs_rehash(stored_hash):
+    """True if ``stored_hash`` was made with other parameters than HASH_METHOD."""
+    global _method_prefix
+
+    # werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"), so take
+    # the prefix from a real hash rather than from the setting
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash("", HASH_METHOD, salt_length=1).split("$", 1)[0]
+
+    return stored_hash.split("$", 1)[0] != _method_prefix